@@ -7,6 +7,7 @@ from telegram.constants import ParseMode
 
 from config import (
     BOT_TOKEN,
+    ADMIN_IDS,
     ERROR_PARSING,
     ERROR_GENERIC,
     ALGEBRA_SOLVE_TEMPLATE,
@@ -19,8 +20,8 @@ from config import (
     DEFAULT_3D_GRID,
     DEFAULT_3D_MODE,
 )
-from parser import parse_input
-from visualizer import plot_function, plot_geometry, plot_parametric, plot_polar, plot_3d
+from parser import parse_input, cache_stats as parser_cache_stats
+from visualizer import plot_function, plot_geometry, plot_parametric, plot_polar, plot_3d, cache_stats as visualizer_cache_stats
 
 # Logging setup
 logging.basicConfig(
@@ -30,6 +31,18 @@ logging.basicConfig(
 
 MAX_TG = 4000
 
+# Кнопки-примеры из /start: callback_data → текст запроса
+_PRESETS = {
+    "ex_quad": "y = x^2",
+    "ex_sin": "y = sin(x)",
+    "ex_circle": "круг r=5",
+}
+
+# Пресеты всегда дают одну и ту же картинку:
+# после первой отправки храним file_id Telegram и больше не рендерим.
+_PRESET_CACHE: dict[str, str] = {}
+_PRESET_STATS = {"hits": 0, "misses": 0}
+
 
 def _truncate(s: str, n: int = MAX_TG) -> str:
     if s is None:
@@ -122,6 +135,44 @@ def _apply_3d_callback(data: str, st: dict) -> bool:
     return True
 
 
+def _render_3d(pr: dict, st: dict):
+    return plot_3d(
+        pr,
+        elev=st["elev"],
+        azim=st["azim"],
+        range_val=st["range"],
+        grid_n=st["grid"],
+        mode=st["mode"],
+        contour_base=st["contour_base"],
+    )
+
+
+# Тип результата парсера → рендер (pr, состояние 3D-камеры) и подпись к картинке
+_PLOT_DISPATCH = {
+    "function": lambda pr, st: plot_function(pr["data"]),
+    "parametric": lambda pr, st: plot_parametric(pr["data"]),
+    "polar": lambda pr, st: plot_polar(pr),
+    "3d": _render_3d,
+    "geometry": lambda pr, st: plot_geometry(pr),
+}
+
+_PLOT_CAPTIONS = {
+    "function": "📊 График по запросу: {text}",
+    "parametric": "➰ Параметрический график: {raw}",
+    "polar": "🌀 Полярный график: {raw}",
+    "3d": "🧊 3D График: {raw}",
+    "geometry": "📐 Фигура по запросу: {text}",
+}
+
+
+async def _render_plot(pr: dict, st: dict = None):
+    """Рисует график в рабочем потоке; None — если для типа нет картинки."""
+    render = _PLOT_DISPATCH.get(pr.get("type"))
+    if render is None:
+        return None
+    return await asyncio.to_thread(render, pr, st)
+
+
 def _refresh_context_cache(context: ContextTypes.DEFAULT_TYPE, text: str, pr: dict) -> None:
     """Кэш для кнопок: формулы и шаги, зависят от типа last_parse_result."""
     context.user_data["last_input"] = text
@@ -142,57 +193,58 @@ def _derive_help_from_parse(text: str, pr: dict) -> tuple:
     t = pr.get("type")
     fml = None
     st = None
-    if t == "function":
-        try:
-            import sympy as _sp
-            parts = [f"• y = {_sp.pretty(e, use_unicode=True)}" for e in pr.get("data", [])]
-        except Exception:
-            parts = [str(p) for p in pr.get("data", [])]
-        fml = "График: на отрезке x ∈ [-10, 10] строим y = f(x).\n" + "\n".join(parts)
-        st = (
-            "1) Парсер читает формулу(ы) как выражения от x.\n"
-            "2) Считаем значения f(x) на сетке из 1000 точек.\n"
-            "3) Между соседними точками при |Δy/Δx| > порога вставляем разрыв (как у асимптот).\n"
-            f"4) Ваш запрос: {text!r}."
-        )
-    elif t == "parametric":
-        fml = f"Параметр t: {pr.get('raw', '')} — x(t), y(t) задают кривую на плоскости."
-        st = (
-            "1) t пробегает от -10 до 10.\n"
-            "2) Считаем (x(t), y(t)) и соединяем точки.\n"
-            f"3) Запрос: {text!r}."
-        )
-    elif t == "polar":
-        fml = "Полярные координаты: x = r(θ)cos(θ), y = r(θ)sin(θ), угол θ от 0 до 4π."
-        st = "1) Находим r как функцию угла.\n2) Переводим в декартовы координаты и строим кривую.\n" + f"3) {text!r}."
-    elif t == "3d":
-        fml = (
-            "Поверхность z = f(x, y) на прямоугольной сетке; z = f(x,y); цвет по высоте z.\n"
-            "Под картинкой — кнопки: камера (elev/azim), зум окна, режим surface/wire/both, контур у zmin, сброс."
-        )
-        st = (
-            "1) Сетка по x,y, считаем z = f(x,y).\n"
-            "2) Рисуем surface и/или wireframe; опционально контур на «полу».\n"
-            "3) Камера: view_init(elev, azim). Зум: меняется полуинтервал R по осям x,y.\n"
-            f"4) Запрос: {text!r}."
-        )
-    elif t == "geometry":
-        sh = pr.get("shape", "")
-        fml = {
-            "circle": "Окружность: площадь πR², длина 2πR; центр из запроса.",
-            "triangle": "Треугольник по сторонам: площадь по формуле Герона; вершины строим по теореме косинусов.",
-            "triangle_points": "По трём точкам: площадь многоугольника (для треугольника) и центры (G, I, O) по координатам.",
-            "line_points": "Прямая через две точки: y − y₁ = k(x − x₁), если не вертикаль; длина отрезка — расстояние между точками.",
-            "polygon_points": "Площадь многоугольника по «шнуровке’ (trapezoid); периметр — сумма сторон.",
-            "rectangle": "Прямоугольник: площадь a·b, периметр 2(a+b).",
-            "ellipse": "Эллипс: площадь πab (полуоси a, b), периметр оценка Рамануджана в тексте к фигуре.",
-        }.get(sh, "Геометрия: стандартные формулы плоскости для данной фигуры.")
-        tr = pr.get("transformations") or []
-        if tr:
-            fml += "\nПреобразования применяются в порядке: сдвиг → (на ваше усмотрение комбинировать) rotate/scale/reflect."
-        st = f"1) Распознана фигура: {sh}.\n2) Считаем вершины/параметры и рисуем с подписями.\n3) {text!r}."
-    else:
-        fml = st = ""
+    match t:
+        case "function":
+            try:
+                import sympy as _sp
+                parts = [f"• y = {_sp.pretty(e, use_unicode=True)}" for e in pr.get("data", [])]
+            except Exception:
+                parts = [str(p) for p in pr.get("data", [])]
+            fml = "График: на отрезке x ∈ [-10, 10] строим y = f(x).\n" + "\n".join(parts)
+            st = (
+                "1) Парсер читает формулу(ы) как выражения от x.\n"
+                "2) Считаем значения f(x) на сетке из 1000 точек.\n"
+                "3) Между соседними точками при |Δy/Δx| > порога вставляем разрыв (как у асимптот).\n"
+                f"4) Ваш запрос: {text!r}."
+            )
+        case "parametric":
+            fml = f"Параметр t: {pr.get('raw', '')} — x(t), y(t) задают кривую на плоскости."
+            st = (
+                "1) t пробегает от -10 до 10.\n"
+                "2) Считаем (x(t), y(t)) и соединяем точки.\n"
+                f"3) Запрос: {text!r}."
+            )
+        case "polar":
+            fml = "Полярные координаты: x = r(θ)cos(θ), y = r(θ)sin(θ), угол θ от 0 до 4π."
+            st = "1) Находим r как функцию угла.\n2) Переводим в декартовы координаты и строим кривую.\n" + f"3) {text!r}."
+        case "3d":
+            fml = (
+                "Поверхность z = f(x, y) на прямоугольной сетке; z = f(x,y); цвет по высоте z.\n"
+                "Под картинкой — кнопки: камера (elev/azim), зум окна, режим surface/wire/both, контур у zmin, сброс."
+            )
+            st = (
+                "1) Сетка по x,y, считаем z = f(x,y).\n"
+                "2) Рисуем surface и/или wireframe; опционально контур на «полу».\n"
+                "3) Камера: view_init(elev, azim). Зум: меняется полуинтервал R по осям x,y.\n"
+                f"4) Запрос: {text!r}."
+            )
+        case "geometry":
+            sh = pr.get("shape", "")
+            fml = {
+                "circle": "Окружность: площадь πR², длина 2πR; центр из запроса.",
+                "triangle": "Треугольник по сторонам: площадь по формуле Герона; вершины строим по теореме косинусов.",
+                "triangle_points": "По трём точкам: площадь многоугольника (для треугольника) и центры (G, I, O) по координатам.",
+                "line_points": "Прямая через две точки: y − y₁ = k(x − x₁), если не вертикаль; длина отрезка — расстояние между точками.",
+                "polygon_points": "Площадь многоугольника по «шнуровке’ (trapezoid); периметр — сумма сторон.",
+                "rectangle": "Прямоугольник: площадь a·b, периметр 2(a+b).",
+                "ellipse": "Эллипс: площадь πab (полуоси a, b), периметр оценка Рамануджана в тексте к фигуре.",
+            }.get(sh, "Геометрия: стандартные формулы плоскости для данной фигуры.")
+            tr = pr.get("transformations") or []
+            if tr:
+                fml += "\nПреобразования применяются в порядке: сдвиг → (на ваше усмотрение комбинировать) rotate/scale/reflect."
+            st = f"1) Распознана фигура: {sh}.\n2) Считаем вершины/параметры и рисуем с подписями.\n3) {text!r}."
+        case _:
+            fml = st = ""
     return fml or "Нет стандартного текста — см. ответ бота.", st or f"См. последний ответ. Запрос: {text!r}."
 
 
@@ -356,6 +408,32 @@ async def examples_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     target_msg = await get_message_target(update)
     if target_msg:
         await target_msg.reply_text(examples_text, parse_mode=ParseMode.MARKDOWN)
+
+
+def _hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits / total:.0%}" if total else "—"
+
+
+async def cachestats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Скрытая команда (нет в меню) для ADMIN_IDS: заполненность кэшей, чтобы подбирать их размеры."""
+    user = update.effective_user
+    if user is None or user.id not in ADMIN_IDS:
+        return
+    lines = ["📦 Кэши:"]
+    for name, info in {**parser_cache_stats(), **visualizer_cache_stats()}.items():
+        lines.append(
+            f"• {name}: hits={info.hits} misses={info.misses} "
+            f"size={info.currsize}/{info.maxsize} hit-rate={_hit_rate(info.hits, info.misses)}"
+        )
+    lines.append(
+        f"• preset file_id: hits={_PRESET_STATS['hits']} misses={_PRESET_STATS['misses']} "
+        f"size={len(_PRESET_CACHE)}/{len(_PRESETS)} hit-rate={_hit_rate(_PRESET_STATS['hits'], _PRESET_STATS['misses'])}"
+    )
+    target_msg = await get_message_target(update)
+    if target_msg:
+        await target_msg.reply_text("\n".join(lines))
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
     if not text:
@@ -366,58 +444,40 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("✅ Спасибо за ваш отзыв! Мы учтём его в будущих обновлениях.")
         return
 
-    status_msg = await update.message.reply_text("⏳ Строю график...")
+    # 1. Parse — до статуса «⏳», чтобы ошибка ввода стоила одно сообщение, а не три
+    try:
+        parse_result = await asyncio.to_thread(parse_input, text)
+    except Exception as e:
+        logging.error(f"Error parsing message: {e}")
+        await update.message.reply_text(f"❌ {ERROR_GENERIC}")
+        return
+
+    if parse_result['type'] == 'error':
+        await update.message.reply_text(f"❌ {ERROR_PARSING}\n{parse_result['message']}")
+        return
 
     try:
-        # 1. Parse
-        parse_result = parse_input(text)
-        
-        if parse_result['type'] == 'error':
-            await status_msg.edit_text(f"❌ {ERROR_PARSING}\n{parse_result['message']}")
+        _refresh_context_cache(context, text, parse_result)
+
+        if parse_result['type'] == 'algebra':
+            response = _format_algebra_message(parse_result)
+            await update.message.reply_text(response, reply_markup=_build_keyboard())
             return
+    except Exception as e:
+        logging.error(f"Error handling message: {e}")
+        await update.message.reply_text(f"❌ {ERROR_GENERIC}")
+        return
 
-        _refresh_context_cache(context, text, parse_result)
+    status_msg = await update.message.reply_text("⏳ Строю график...")
 
+    try:
         # 2. Visualize
-        img_buffer = None
-        caption = ""
-        keyboard = _build_keyboard()
-        
-        if parse_result['type'] == 'function':
-            img_buffer = await asyncio.to_thread(plot_function, parse_result['data'])
-            caption = f"📊 График по запросу: {text}"
-            
-        elif parse_result['type'] == 'parametric':
-            img_buffer = await asyncio.to_thread(plot_parametric, parse_result['data'])
-            caption = f"➰ Параметрический график: {parse_result['raw']}"
-
-        elif parse_result['type'] == 'polar':
-            img_buffer = await asyncio.to_thread(plot_polar, parse_result)
-            caption = f"🌀 Полярный график: {parse_result['raw']}"
-
-        elif parse_result['type'] == '3d':
+        is_3d = parse_result['type'] == '3d'
+        if is_3d:
             context.user_data["plot3d"] = _default_plot3d_state()
-            st = context.user_data["plot3d"]
-            img_buffer = await asyncio.to_thread(
-                plot_3d,
-                parse_result,
-                elev=st["elev"],
-                azim=st["azim"],
-                range_val=st["range"],
-                grid_n=st["grid"],
-                mode=st["mode"],
-                contour_base=st["contour_base"],
-            )
-            caption = f"🧊 3D График: {parse_result['raw']}"
-            keyboard = _build_keyboard(include_3d=True)
-
-        elif parse_result['type'] == 'geometry':
-            img_buffer = await asyncio.to_thread(plot_geometry, parse_result)
-            caption = f"📐 Фигура по запросу: {text}"
-        elif parse_result['type'] == 'algebra':
-            response = _format_algebra_message(parse_result)
-            await status_msg.edit_text(response, reply_markup=keyboard)
-            return
+        img_buffer = await _render_plot(parse_result, context.user_data.get("plot3d"))
+        caption = _PLOT_CAPTIONS.get(parse_result['type'], "").format(text=text, raw=parse_result.get('raw', ''))
+        keyboard = _build_keyboard(include_3d=is_3d)
 
         # 3. Send
         if img_buffer:
@@ -435,15 +495,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     data = query.data
-    text_to_process = ""
+    text_to_process = _PRESETS.get(data, "")
     
-    if data == 'ex_quad':
-        text_to_process = "y = x^2"
-    elif data == 'ex_sin':
-        text_to_process = "y = sin(x)"
-    elif data == 'ex_circle':
-        text_to_process = "круг r=5"
-    elif data == 'help_examples':
+    if data == 'help_examples':
         await examples_command(update, context) 
         return
     elif data == 'help_start':
@@ -507,16 +561,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         status_msg = await context.bot.send_message(chat_id=query.message.chat_id, text="⏳ Пересчёт 3D...")
         try:
-            img_buffer = await asyncio.to_thread(
-                plot_3d,
-                pr,
-                elev=st["elev"],
-                azim=st["azim"],
-                range_val=st["range"],
-                grid_n=st["grid"],
-                mode=st["mode"],
-                contour_base=st["contour_base"],
-            )
+            img_buffer = await _render_plot(pr, st)
             cap = (
                 f"🧊 3D: {pr.get('raw', '')}\n"
                 f"elev={st['elev']:.0f}° azim={st['azim']:.0f}° | окно ±{st['range']:.2f} | "
@@ -535,45 +580,41 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     if text_to_process:
         await context.bot.send_message(chat_id=query.message.chat_id, text=f"Выбрано: {text_to_process}")
-        
+
+        cached_photo = _PRESET_CACHE.get(data)
+        _PRESET_STATS["hits" if cached_photo else "misses"] += 1
+        if cached_photo:
+            parse_result = await asyncio.to_thread(parse_input, text_to_process)
+            _refresh_context_cache(context, text_to_process, parse_result)
+            await context.bot.send_photo(
+                chat_id=query.message.chat_id,
+                photo=cached_photo,
+                caption=f"Пресет: {text_to_process}",
+                reply_markup=_build_keyboard(include_3d=(parse_result.get("type") == "3d")),
+            )
+            return
+
         status_msg = await context.bot.send_message(chat_id=query.message.chat_id, text="⏳ Строю график...")
         try:
-            parse_result = parse_input(text_to_process)
+            parse_result = await asyncio.to_thread(parse_input, text_to_process)
             if parse_result['type'] == 'error':
                 await status_msg.edit_text(f"❌ {ERROR_PARSING}\n{parse_result['message']}")
                 return
             _refresh_context_cache(context, text_to_process, parse_result)
-            img_buffer = None
-            if parse_result['type'] == 'function':
-                img_buffer = await asyncio.to_thread(plot_function, parse_result['data'])
-            elif parse_result['type'] == 'parametric':
-                img_buffer = await asyncio.to_thread(plot_parametric, parse_result['data'])
-            elif parse_result['type'] == 'polar':
-                img_buffer = await asyncio.to_thread(plot_polar, parse_result)
-            elif parse_result['type'] == '3d':
+            if parse_result['type'] == '3d':
                 context.user_data["plot3d"] = _default_plot3d_state()
-                st = context.user_data["plot3d"]
-                img_buffer = await asyncio.to_thread(
-                    plot_3d,
-                    parse_result,
-                    elev=st["elev"],
-                    azim=st["azim"],
-                    range_val=st["range"],
-                    grid_n=st["grid"],
-                    mode=st["mode"],
-                    contour_base=st["contour_base"],
-                )
-            elif parse_result['type'] == 'geometry':
-                img_buffer = await asyncio.to_thread(plot_geometry, parse_result)
-            
+            img_buffer = await _render_plot(parse_result, context.user_data.get("plot3d"))
+
             if img_buffer:
                 kbd = _build_keyboard(include_3d=(parse_result.get("type") == "3d"))
-                await context.bot.send_photo(
+                sent = await context.bot.send_photo(
                     chat_id=query.message.chat_id,
                     photo=img_buffer,
                     caption=f"Пресет: {text_to_process}",
                     reply_markup=kbd,
                 )
+                if sent.photo:
+                    _PRESET_CACHE[data] = sent.photo[-1].file_id
                 await status_msg.delete()
             else:
                 await status_msg.edit_text(f"❌ {ERROR_GENERIC}")
@@ -581,6 +622,32 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logging.error(f"Error handling button: {e}")
             await status_msg.edit_text(f"❌ {ERROR_GENERIC}")
 
+# По одному запросу на каждую ветку _PLOT_DISPATCH (пресеты заодно попадают в кэш парсера)
+_WARMUP_INPUTS = (
+    *_PRESETS.values(),
+    "x = cos(t), y = sin(t)",
+    "r = 1 + cos(t)",
+    "z = x^2 + y^2",
+)
+
+
+def _warmup() -> None:
+    """
+    Прогрев до run_polling: ленивые импорты SymPy, кэш шрифтов и mathtext matplotlib,
+    lru-кэши парсера и визуализатора. Иначе первый пользователь после рестарта ждёт
+    несколько секунд. Figure из _TLS, созданные здесь, в главном потоке, рабочим
+    потокам asyncio.to_thread не достаются: греются только общие для процесса кэши.
+    """
+    for text in _WARMUP_INPUTS:
+        try:
+            pr = parse_input(text)
+            render = _PLOT_DISPATCH.get(pr["type"])
+            if render:
+                render(pr, _default_plot3d_state())
+        except Exception as e:
+            logging.warning(f"Warmup failed for {text!r}: {e}")
+
+
 async def post_init(app: Application):
     await app.bot.set_my_commands([
         BotCommand("start", "Запустить бота"),
@@ -600,10 +667,12 @@ if __name__ == '__main__':
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("examples", examples_command))
     application.add_handler(CommandHandler("feedback", feedback_command))
+    application.add_handler(CommandHandler("cachestats", cachestats_command))
     application.add_handler(CallbackQueryHandler(button_handler))
     
     # Generic text handler
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
     
+    _warmup()
     print("Bot is running...")
     application.run_polling()
@@ -1,3 +1,4 @@
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -5,9 +6,29 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+
+def _parse_admin_ids(raw):
+    """Telegram user id через запятую; некорректные записи пропускаем с предупреждением."""
+    ids = set()
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            ids.add(int(item))
+        except ValueError:
+            logging.getLogger(__name__).warning("ADMIN_IDS: пропущено некорректное значение %r", item)
+    return frozenset(ids)
+
+
+# Администраторы: им доступен /cachestats
+ADMIN_IDS = _parse_admin_ids(os.getenv("ADMIN_IDS", ""))
+
 # Plotting configuration
 PLOT_SIZE = (10, 8)  # Inches
 DPI = 100
+# zlib-уровень PNG: 3 заметно быстрее дефолтных 6 при размере файла +5–15%
+PNG_COMPRESS_LEVEL = 3
 DEFAULT_X_RANGE = (-10, 10)
 DEFAULT_Y_RANGE = (-10, 10)
 
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import math
 import numpy as np
 from matplotlib.patches import Circle, Polygon, Rectangle, Ellipse
 
@@ -78,8 +79,8 @@ class CircleShape(GeometricShape):
         ax.set_ylim(self.center.y - self.radius * 1.6, self.center.y + self.radius * 1.6)
 
     def get_details(self):
-        area = np.pi * self.radius ** 2
-        circumference = 2 * np.pi * self.radius
+        area = math.pi * self.radius * self.radius
+        circumference = 2.0 * math.pi * self.radius
         return f"Круг: R={self.radius}, Площадь={area:.2f}, Периметр={circumference:.2f}"
 
     def transformed(self, transforms):
@@ -96,16 +97,20 @@ class TriangleShape(GeometricShape):
         self.a = a
         self.b = b
         self.c = c
+        self.is_valid = min(a, b, c) > 0 and a + b > c and a + c > b and b + c > a
+        # Периметр и площадь по Герону считаем один раз: нужны и вершинам, и get_details
+        self.perimeter = a + b + c
+        s = self.perimeter / 2
+        self.area = math.sqrt(max(s * (s - a) * (s - b) * (s - c), 0.0)) if self.is_valid else 0.0
         self.points = self._build_points_from_sides()
 
     def _build_points_from_sides(self):
-        if min(self.a, self.b, self.c) <= 0:
+        if not self.is_valid:
             return []
-        if self.a + self.b <= self.c or self.a + self.c <= self.b or self.b + self.c <= self.a:
-            return []
-        cos_c = np.clip((self.a**2 + self.b**2 - self.c**2) / (2 * self.a * self.b), -1.0, 1.0)
-        angle_c = np.arccos(cos_c)
-        return [Point(0, 0), Point(self.a, 0), Point(self.b * np.cos(angle_c), self.b * np.sin(angle_c))]
+        # Угол C между сторонами a и b: cos по теореме косинусов, sin из площади S = ab·sinC/2
+        cos_c = min(1.0, max(-1.0, (self.a * self.a + self.b * self.b - self.c * self.c) / (2 * self.a * self.b)))
+        sin_c = 2 * self.area / (self.a * self.b)
+        return [Point(0, 0), Point(self.a, 0), Point(self.b * cos_c, self.b * sin_c)]
 
     def triangle_centers(self):
         if len(self.points) != 3:
@@ -145,8 +150,8 @@ class TriangleShape(GeometricShape):
         if len(self.points) != 3:
             ax.text(0.5, 0.5, "Некорректный треугольник", ha='center', va='center')
             return
-        arr = _to_np(self.points)
-        triangle = Polygon(arr, fill=False, color=color, linewidth=2, alpha=alpha)
+        points = tuple(p.as_tuple() for p in self.points)
+        triangle = Polygon(points, fill=False, color=color, linewidth=2, alpha=alpha)
         ax.add_patch(triangle)
         ax.set_aspect('equal')
         ax.autoscale_view()
@@ -154,10 +159,7 @@ class TriangleShape(GeometricShape):
     def get_details(self):
         if len(self.points) != 3:
             return f"Треугольник: a={self.a}, b={self.b}, c={self.c}\nНекорректные стороны"
-        s = (self.a + self.b + self.c) / 2
-        area = np.sqrt(s * (s - self.a) * (s - self.b) * (s - self.c))
-        perimeter = self.a + self.b + self.c
-        return f"Треугольник: a={self.a}, b={self.b}, c={self.c}\nПлощадь={area:.2f}, Периметр={perimeter:.2f}"
+        return f"Треугольник: a={self.a}, b={self.b}, c={self.c}\nПлощадь={self.area:.2f}, Периметр={self.perimeter:.2f}"
 
 
 class TrianglePointsShape(GeometricShape):
@@ -166,20 +168,20 @@ class TrianglePointsShape(GeometricShape):
         self.labels = labels or ["A", "B", "C"]
 
     def plot(self, ax, color="tab:green", alpha=1.0):
-        arr = _to_np(self.points)
-        triangle = Polygon(arr, fill=False, color=color, linewidth=2, alpha=alpha)
+        points = tuple(p.as_tuple() for p in self.points)
+        triangle = Polygon(points, fill=False, color=color, linewidth=2, alpha=alpha)
         ax.add_patch(triangle)
         ax.set_aspect("equal")
         ax.autoscale_view()
 
     def get_details(self):
-        arr = _to_np(self.points)
-        a = np.linalg.norm(arr[1] - arr[2])
-        b = np.linalg.norm(arr[0] - arr[2])
-        c = np.linalg.norm(arr[0] - arr[1])
+        p0, p1, p2 = (p.as_tuple() for p in self.points)
+        a = math.dist(p1, p2)
+        b = math.dist(p0, p2)
+        c = math.dist(p0, p1)
         perimeter = a + b + c
         s = perimeter / 2
-        area = np.sqrt(max(s * (s - a) * (s - b) * (s - c), 0.0))
+        area = math.sqrt(max(s * (s - a) * (s - b) * (s - c), 0.0))
         return f"Треугольник по точкам: Площадь={area:.2f}, Периметр={perimeter:.2f}"
 
     def triangle_centers(self):
@@ -202,7 +204,7 @@ class LineShape(GeometricShape):
         ax.autoscale_view()
 
     def get_details(self):
-        length = np.hypot(self.p2.x - self.p1.x, self.p2.y - self.p1.y)
+        length = math.hypot(self.p2.x - self.p1.x, self.p2.y - self.p1.y)
         return f"Прямая через 2 точки, длина отрезка={length:.2f}"
 
     def transformed(self, transforms):
@@ -215,8 +217,8 @@ class PolygonShape(GeometricShape):
         self.points = points
 
     def plot(self, ax, color="tab:red", alpha=1.0):
-        arr = _to_np(self.points)
-        poly = Polygon(arr, fill=False, color=color, linewidth=2, alpha=alpha)
+        points = tuple(p.as_tuple() for p in self.points)
+        poly = Polygon(points, fill=False, color=color, linewidth=2, alpha=alpha)
         ax.add_patch(poly)
         ax.set_aspect("equal")
         ax.autoscale_view()
@@ -269,6 +271,6 @@ class EllipseShape(GeometricShape):
         a = self.width / 2
         b = self.height / 2
         h = ((a - b) ** 2) / ((a + b) ** 2) if (a + b) else 0
-        perimeter = np.pi * (a + b) * (1 + (3 * h) / (10 + np.sqrt(max(4 - 3 * h, 1e-9))))
-        area = np.pi * a * b
+        perimeter = math.pi * (a + b) * (1 + (3 * h) / (10 + math.sqrt(max(4 - 3 * h, 1e-9))))
+        area = math.pi * a * b
         return f"Эллипс: a={a}, b={b}, Площадь={area:.2f}, Периметр≈{perimeter:.2f}"
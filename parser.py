@@ -1,5 +1,6 @@
 import re
 import unicodedata
+from functools import lru_cache
 import sympy
 from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application, convert_xor
 
@@ -18,6 +19,10 @@ FUNCTION_MAPPINGS = {
     'арктангенс': 'atan',
 }
 
+# Один проход вместо str.replace на каждое слово; длинные слова первыми,
+# чтобы «арксинус» и «котангенс» не превращались в «аркsin» и «коtan»
+FUNCTION_NAME_RE = re.compile('|'.join(map(re.escape, sorted(FUNCTION_MAPPINGS, key=len, reverse=True))))
+
 GEOMETRY_KEYWORDS = {
     'круг': 'circle',
     'окружность': 'circle',
@@ -64,8 +69,68 @@ SAFE_GLOBALS = {
     "Rational": sympy.Rational,
 }
 
+# Таблицы для str.translate: одна замена за проход вместо str.replace на каждый символ
+SUPERSCRIPT_TABLE = str.maketrans({
+    "\u2070": "**0",
+    "\u00b9": "**1",
+    "\u00b2": "**2",
+    "\u00b3": "**3",
+    "\u2074": "**4",
+    "\u2075": "**5",
+    "\u2076": "**6",
+    "\u2077": "**7",
+    "\u2078": "**8",
+    "\u2079": "**9",
+})
+UNICODE_OPERATOR_TABLE = str.maketrans({
+    "\u00d7": "*",  # ×
+    "\u22c5": "*",  # ⋅
+    "\u00b7": "*",  # ·
+    "\u2212": "-",  # −
+    "\u2013": "-",
+    "\u2014": "-",
+    "\u2264": "<=",
+    "\u2265": ">=",
+    "\u2260": "!=",
+    "\u221e": "oo",  # ∞ → SymPy oo
+    "\u03c0": "pi",  # π
+    "\u03a0": "pi",  # Π как константа
+    "\u200b": None,  # zero-width space (NFKC его не убирает)
+    "\u2060": None,  # word joiner
+    "\ufeff": None,  # BOM
+})
+
 POINT_RE = re.compile(r'([a-zа-я])?\s*\(\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\)', re.IGNORECASE)
 
+# Все шаблоны компилируются один раз при импорте, а не на каждое сообщение
+ABS_RE = re.compile(r'\|([^|]+)\|')
+Z_ASSIGN_RE = re.compile(r'\bz\s*(?<![<>!])=(?![=])')
+R_ASSIGN_RE = re.compile(r'\br\s*(?<![<>!])=(?![=])')
+X_ASSIGN_RE = re.compile(r'\bx\s*(?<![<>!])=(?![=])')
+Y_ASSIGN_RE = re.compile(r'\by\s*(?<![<>!])=(?![=])')
+X_PART_RE = re.compile(r'^x\s*(?<![<>!])=(?![=])')
+Y_PART_RE = re.compile(r'^y\s*(?<![<>!])=(?![=])')
+SPLIT_XY_RE = re.compile(r'[;,]')
+FUNC_PREFIX_RE = re.compile(r'^(?:y|f\(x\))\s*=\s*')
+
+# Параметры фигур «ключ=число» собираются одним проходом: r=5, a=3, ширина=10, ...
+KV_RE = re.compile(r'([a-zа-яё]+)\s*=\s*(\d+(?:\.\d+)?)')
+CIRCLE_CENTER_RE = re.compile(r'центр\s*\(\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\)')
+
+TRANSLATE_RE = re.compile(r'(?:translate|сдвиг)\s*[:=]?\s*dx\s*=?\s*(-?\d+(?:\.\d+)?)\s*(?:dy\s*=?\s*(-?\d+(?:\.\d+)?))?')
+ROTATE_RE = re.compile(r'(?:rotate|поворот)\s*[:=]?\s*(?:угол\s*=?\s*)?(-?\d+(?:\.\d+)?)')
+SCALE_RE = re.compile(r'(?:scale|масштаб)\s*[:=]?\s*(?:k\s*=?\s*)?(-?\d+(?:\.\d+)?)')
+REFLECT_RE = re.compile(r'(?:reflect|отражение)\s*(?:относительно)?\s*(x|y|origin)')
+
+_CBRT = "\u221b"  # ∛
+_SQRT = "\u221a"  # √
+_DVERT = "\u2016"  # ‖
+CBRT_NUM_RE = re.compile(_CBRT + r"(\d+(?:[.,]\d+)?)")
+CBRT_VAR_RE = re.compile(_CBRT + "([xyztp])")
+SQRT_NUM_RE = re.compile(_SQRT + r"(\d+(?:[.,]\d+)?)")
+SQRT_VAR_RE = re.compile(_SQRT + "([xyztp])")
+DVERT_ABS_RE = re.compile(_DVERT + "([^" + _DVERT + "]+)" + _DVERT)
+
 def _safe_parse_expr(expr_str):
     """Parse user expression with restricted namespace."""
     candidate = expr_str.strip()
@@ -81,6 +146,17 @@ def _safe_parse_expr(expr_str):
     )
 
 
+def polar_variable(expr):
+    """Угловая переменная полярного уравнения: t, theta, phi или x; иначе первый свободный символ."""
+    free_symbols = sorted(expr.free_symbols, key=lambda s: s.name)
+    if not free_symbols:
+        return ALLOWED_SYMBOLS['t']
+    for s in free_symbols:
+        if s.name in ('t', 'theta', 'phi', 'x'):  # allow x as parameter too
+            return s
+    return free_symbols[0]
+
+
 def _extract_points(text):
     points = []
     labels = []
@@ -99,7 +175,7 @@ def _parse_transformations(text):
         return transforms
 
     chunk = text.lower()
-    translate_match = re.search(r'(?:translate|сдвиг)\s*[:=]?\s*dx\s*=?\s*(-?\d+(?:\.\d+)?)\s*(?:dy\s*=?\s*(-?\d+(?:\.\d+)?))?', chunk)
+    translate_match = TRANSLATE_RE.search(chunk)
     if translate_match:
         transforms.append({
             "op": "translate",
@@ -107,15 +183,15 @@ def _parse_transformations(text):
             "dy": float(translate_match.group(2) or 0.0),
         })
 
-    rotate_match = re.search(r'(?:rotate|поворот)\s*[:=]?\s*(?:угол\s*=?\s*)?(-?\d+(?:\.\d+)?)', chunk)
+    rotate_match = ROTATE_RE.search(chunk)
     if rotate_match:
         transforms.append({"op": "rotate", "angle": float(rotate_match.group(1)), "origin": (0.0, 0.0)})
 
-    scale_match = re.search(r'(?:scale|масштаб)\s*[:=]?\s*(?:k\s*=?\s*)?(-?\d+(?:\.\d+)?)', chunk)
+    scale_match = SCALE_RE.search(chunk)
     if scale_match:
         transforms.append({"op": "scale", "k": float(scale_match.group(1)), "origin": (0.0, 0.0)})
 
-    reflect_match = re.search(r'(?:reflect|отражение)\s*(?:относительно)?\s*(x|y|origin)', chunk)
+    reflect_match = REFLECT_RE.search(chunk)
     if reflect_match:
         transforms.append({"op": "reflect", "axis": reflect_match.group(1)})
     return transforms
@@ -127,57 +203,23 @@ def _unicode_math_aliases(text):
     Вызывается до .lower(), чтобы сохранить π→pi и т.п.
     """
     # Степени до NFKC: иначе ²→2 и получится x2 вместо x**2
-    sup_map = {
-        "\u2070": "0",
-        "\u00b9": "1",
-        "\u00b2": "2",
-        "\u00b3": "3",
-        "\u2074": "4",
-        "\u2075": "5",
-        "\u2076": "6",
-        "\u2077": "7",
-        "\u2078": "8",
-        "\u2079": "9",
-    }
-    for u, d in sup_map.items():
-        text = text.replace(u, f"**{d}")
+    text = text.translate(SUPERSCRIPT_TABLE)
+    # NFKC заодно превращает неразрывные пробелы в обычные
     text = unicodedata.normalize("NFKC", text)
     # Частые операторы и константы
-    text = text.replace("\u00d7", "*")  # ×
-    text = text.replace("\u22c5", "*")  # ⋅
-    text = text.replace("\u00b7", "*")  # ·
-    text = text.replace("\u2212", "-")  # −
-    text = text.replace("\u2013", "-")
-    text = text.replace("\u2014", "-")
-    text = text.replace("\u2264", "<=")
-    text = text.replace("\u2265", ">=")
-    text = text.replace("\u2260", "!=")
-    text = text.replace("\u221e", "oo")  # ∞ → SymPy oo
-    text = text.replace("\u03c0", "pi")  # π
-    text = text.replace("\u03a0", "pi")  # Π как константа
-    _cbrt = "\u221b"  # ∛
-    _sqrt = "\u221a"  # √
-    _dvert = "\u2016"  # ‖
+    text = text.translate(UNICODE_OPERATOR_TABLE)
     # Кубический корень ∛
-    while _cbrt + "(" in text:
-        text = text.replace(_cbrt + "(", "cbrt(", 1)
-    text = re.sub(
-        _cbrt + r"(\d+(?:[.,]\d+)?)",
-        lambda m: "cbrt(" + m.group(1).replace(",", ".") + ")",
-        text,
-    )
-    text = re.sub(_cbrt + "([xyztp])", r"cbrt(\1)", text)
+    while _CBRT + "(" in text:
+        text = text.replace(_CBRT + "(", "cbrt(", 1)
+    text = CBRT_NUM_RE.sub(lambda m: "cbrt(" + m.group(1).replace(",", ".") + ")", text)
+    text = CBRT_VAR_RE.sub(r"cbrt(\1)", text)
     # Квадратный корень √
-    while _sqrt + "(" in text:
-        text = text.replace(_sqrt + "(", "sqrt(", 1)
-    text = re.sub(
-        _sqrt + r"(\d+(?:[.,]\d+)?)",
-        lambda m: "sqrt(" + m.group(1).replace(",", ".") + ")",
-        text,
-    )
-    text = re.sub(_sqrt + "([xyztp])", r"sqrt(\1)", text)
+    while _SQRT + "(" in text:
+        text = text.replace(_SQRT + "(", "sqrt(", 1)
+    text = SQRT_NUM_RE.sub(lambda m: "sqrt(" + m.group(1).replace(",", ".") + ")", text)
+    text = SQRT_VAR_RE.sub(r"sqrt(\1)", text)
     # Модуль ‖…‖ (двойная вертикаль)
-    text = re.sub(_dvert + "([^" + _dvert + "]+)" + _dvert, r"abs(\1)", text)
+    text = DVERT_ABS_RE.sub(r"abs(\1)", text)
     return text
 
 
@@ -190,10 +232,9 @@ def preprocess_input(text):
     
     # Replace |expr| with abs(expr)
     # Greedy match might be an issue for |x| + |y|, so use non-greedy
-    text = re.sub(r'\|([^|]+)\|', r'abs(\1)', text)
+    text = ABS_RE.sub(r'abs(\1)', text)
 
-    for rus, eng in FUNCTION_MAPPINGS.items():
-        text = text.replace(rus, eng)
+    text = FUNCTION_NAME_RE.sub(lambda m: FUNCTION_MAPPINGS[m.group(0)], text)
     return text
 
 def parse_input(text):
@@ -201,7 +242,12 @@ def parse_input(text):
     Parses the user input and determines if it's a function plotting request
     (standard, parametric, piecewise) or a geometry visualization request.
     """
-    text = preprocess_input(text)
+    # Кэш по нормализованному тексту: пресеты и повторные запросы не гоняют parse_expr заново
+    return dict(_parse_input_cached(preprocess_input(text)))
+
+
+@lru_cache(maxsize=512)
+def _parse_input_cached(text):
     base_text = text
     transform_text = ""
     if "|" in text:
@@ -238,35 +284,37 @@ def parse_input(text):
     
     # Check for 3D: "z = x^2 + y^2"
     # Look for assignment to z (strictly z=, likely containing x and y)
-    if re.search(r'\bz\s*(?<![<>!])=(?![=])', base_text):
+    z_match = Z_ASSIGN_RE.search(base_text)
+    if z_match:
         # Extract the RHS
-        rhs = re.split(r'\bz\s*=', base_text, 1)[1].strip()
+        rhs = base_text[z_match.end():].strip()
         return parse_3d(rhs)
         
     # Check for Polar: "r = 1 + cos(t)" or "r = t"
-    if re.search(r'\br\s*(?<![<>!])=(?![=])', base_text):
-        rhs = re.split(r'\br\s*=', base_text, 1)[1].strip()
+    r_match = R_ASSIGN_RE.search(base_text)
+    if r_match:
+        rhs = base_text[r_match.end():].strip()
         return parse_polar(rhs)
 
     # Check for parametric equations: "x = cos(t), y = sin(t)"
     # Simplistic check: must contain both "x=" and "y=" assignments
     # Use regex to avoid matching x>=0 as x=
     # We look for x followed by = (not >=, <=, ==, !=)
-    has_x_assign = re.search(r'\bx\s*(?<![<>!])=(?![=])', base_text)
-    has_y_assign = re.search(r'\by\s*(?<![<>!])=(?![=])', base_text)
+    has_x_assign = X_ASSIGN_RE.search(base_text)
+    has_y_assign = Y_ASSIGN_RE.search(base_text)
     
     if has_x_assign and has_y_assign:
         # Allow semicolon or comma separation
-        parts = re.split(r'[;,]', base_text)
+        parts = SPLIT_XY_RE.split(base_text)
         if len(parts) >= 2:
             x_part = None
             y_part = None
             for p in parts:
                 p = p.strip()
                 # Check strict assignment again for parts
-                if re.match(r'^x\s*(?<![<>!])=(?![=])', p):
+                if X_PART_RE.match(p):
                     x_part = p.split('=', 1)[1].strip()
-                elif re.match(r'^y\s*(?<![<>!])=(?![=])', p):
+                elif Y_PART_RE.match(p):
                     y_part = p.split('=', 1)[1].strip()
             
             if x_part and y_part:
@@ -275,18 +323,37 @@ def parse_input(text):
     # Default to standard/piecewise function parsing
     return parse_multiple_functions(base_text)
 
+def cache_stats():
+    """cache_info() кэшей парсера по именам — для /cachestats."""
+    return {"parse_input": _parse_input_cached.cache_info()}
+
+def _key_values(text):
+    params = {}
+    for key, value in KV_RE.findall(text):
+        params.setdefault(key, float(value))
+    return params
+
+
+def _pick(params, *keys):
+    for key in keys:
+        if key in params:
+            return params[key]
+    return None
+
+
 def parse_geometry(text, shape_type):
     try:
         points, labels = _extract_points(text)
+        params = _key_values(text)
         if shape_type == 'circle':
-            # "круг r=5" or "окружность радиус 3"
-            r_match = re.search(r'(?:r|радиус)\s*=\s*(\d+(\.\d+)?)', text)
-            center_match = re.search(r'центр\s*\(\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\)', text)
+            # "круг r=5" or "окружность радиус=3"
+            radius = _pick(params, 'r', 'радиус')
+            center_match = CIRCLE_CENTER_RE.search(text)
             center = (0.0, 0.0)
             if center_match:
                 center = (float(center_match.group(1)), float(center_match.group(2)))
-            if r_match:
-                return {'type': 'geometry', 'shape': 'circle', 'r': float(r_match.group(1)), 'center': center}
+            if radius is not None:
+                return {'type': 'geometry', 'shape': 'circle', 'r': radius, 'center': center}
             else:
                 return {'type': 'error', 'message': "Укажите радиус, например: круг r=5"}
                 
@@ -294,14 +361,13 @@ def parse_geometry(text, shape_type):
             if len(points) == 3:
                 return {'type': 'geometry', 'shape': 'triangle_points', 'points': points, 'labels': labels[:3]}
             # "треугольник a=3 b=4 c=5"
-            params = {}
-            for param in ['a', 'b', 'c']:
-                match = re.search(f'{param}\s*=\s*(\d+(\.\d+)?)', text)
-                if match:
-                    params[param] = float(match.group(1))
+            sides = {side: params[side] for side in ('a', 'b', 'c') if side in params}
             
-            if len(params) == 3:
-                return {'type': 'geometry', 'shape': 'triangle', **params}
+            if len(sides) == 3:
+                a, b, c = sides['a'], sides['b'], sides['c']
+                if a + b <= c or a + c <= b or b + c <= a:
+                    return {'type': 'error', 'message': "Такой треугольник не существует: каждая сторона должна быть меньше суммы двух других."}
+                return {'type': 'geometry', 'shape': 'triangle', **sides}
             else:
                 return {'type': 'error', 'message': "Укажите стороны a, b, c, например: треугольник a=3 b=4 c=5"}
         elif shape_type == 'line':
@@ -315,21 +381,21 @@ def parse_geometry(text, shape_type):
 
         elif shape_type == 'rectangle':
              # "прямоугольник a=5 b=3" or "width=5 height=3"
-            match_a = re.search(r'(?:a|width|ширина)\s*=\s*(\d+(\.\d+)?)', text)
-            match_b = re.search(r'(?:b|height|высота)\s*=\s*(\d+(\.\d+)?)', text)
+            width = _pick(params, 'a', 'width', 'ширина')
+            height = _pick(params, 'b', 'height', 'высота')
             
-            if match_a and match_b:
-                return {'type': 'geometry', 'shape': 'rectangle', 'width': float(match_a.group(1)), 'height': float(match_b.group(1))}
+            if width is not None and height is not None:
+                return {'type': 'geometry', 'shape': 'rectangle', 'width': width, 'height': height}
             else:
                 return {'type': 'error', 'message': "Укажите стороны, например: прямоугольник a=5 b=3"}
 
         elif shape_type == 'ellipse':
              # "эллипс a=4 b=2"
-            match_a = re.search(r'a\s*=\s*(\d+(\.\d+)?)', text)
-            match_b = re.search(r'b\s*=\s*(\d+(\.\d+)?)', text)
+            semi_a = params.get('a')
+            semi_b = params.get('b')
             
-            if match_a and match_b:
-                return {'type': 'geometry', 'shape': 'ellipse', 'width': float(match_a.group(1)) * 2, 'height': float(match_b.group(1)) * 2}
+            if semi_a is not None and semi_b is not None:
+                return {'type': 'geometry', 'shape': 'ellipse', 'width': semi_a * 2, 'height': semi_b * 2}
             else:
                  return {'type': 'error', 'message': "Укажите полуоси a и b, например: эллипс a=4 b=2"}
                  
@@ -425,9 +491,11 @@ def parse_parametric(x_str, y_str):
 def parse_polar(r_str):
     try:
         expr = _safe_parse_expr(r_str)
+        var_sym = polar_variable(expr)
         return {
             'type': 'polar',
             'data': expr,
+            'var': var_sym,
             'raw': r_str
         }
     except Exception as e:
@@ -444,35 +512,39 @@ def parse_3d(z_str):
     except Exception as e:
         return {'type': 'error', 'message': f"Ошибка разбора 3D функции: {e}"}
 
+def _top_level_split(text, sep=';'):
+    """Делит по sep только вне фигурных скобок: ; внутри { } разделяет ветви кусочной функции."""
+    out = []
+    start = 0
+    depth = 0
+    for i, c in enumerate(text):
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+        elif c == sep and depth == 0:
+            out.append(text[start:i])
+            start = i + 1
+    out.append(text[start:])
+    return out
+
 def parse_multiple_functions(text):
-    # Handle piecewise functions having semicolons inside { }
-    # We replace ; inside {} with a placeholder
-    def replacement(match):
-        return match.group(0).replace(';', '##SEMICOLON##')
-    
-    # Regex to find { ... } blocks and replace ; inside them
-    # Non-nested
-    text_processed = re.sub(r'\{[^}]*\}', replacement, text)
-    
-    # Split by semicolon for multiple functions
-    parts = text_processed.split(';')
+    # Split by semicolon for multiple functions (piecewise { ...; ... } stays whole)
+    parts = _top_level_split(text)
     functions = []
     
     for part in parts:
-        # Restore semicolon
-        part = part.replace('##SEMICOLON##', ';')
         part = part.strip()
         if not part: continue
         
         # Remove "y =" or "f(x) =" if present
-        part = re.sub(r'^(?:y|f\(x\))\s*=\s*', '', part)
+        part = FUNC_PREFIX_RE.sub('', part)
         
         try:
             # Check for piecewise syntax: { expr1, cond1; expr2, cond2 }
             if part.startswith('{') and part.endswith('}'):
                 content = part[1:-1]
-                # We replaced ; with ##SEMICOLON##, so split by that
-                segments = content.split('##SEMICOLON##')
+                segments = content.split(';')
                 piecewise_args = []
                 for segment in segments:
                     if ',' in segment:
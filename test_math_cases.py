@@ -2,8 +2,10 @@
 import unittest
 import os
 import shutil
-from parser import parse_input
-from visualizer import plot_function, plot_geometry, plot_parametric, plot_polar, plot_3d
+import numpy as np
+import visualizer
+from parser import parse_input, preprocess_input
+from visualizer import plot_function, plot_geometry, plot_parametric, plot_polar, plot_3d, _lambdify_cached, _may_have_asymptote
 
 class TestMathBot(unittest.TestCase):
     OUTPUT_DIR = "test_output"
@@ -99,5 +101,49 @@ class TestMathBot(unittest.TestCase):
 
                 self.run_case(text, idx)
 
+    def test_parse_cache_returns_copy(self):
+        first = parse_input("y = x^2")
+        second = parse_input("  Y = x^2 ")
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    def test_russian_function_names(self):
+        self.assertEqual(preprocess_input("y = синус(x) + арксинус(x)"), "y = sin(x) + asin(x)")
+        self.assertEqual(preprocess_input("y = котангенс(x)"), "y = cot(x)")
+
+    def test_impossible_triangle_is_rejected(self):
+        self.assertEqual(parse_input("треугольник a=1 b=2 c=5")['type'], 'error')
+
+    def test_unicode_math_aliases(self):
+        self.assertEqual(preprocess_input("y\u00a0=\u00a0x² − 2πx\u200b"), "y = x**2 - 2pix")
+
+    def test_repeat_plot_reuses_lambdify(self):
+        result = parse_input("y = x^3 - 2*x")
+        before = _lambdify_cached.cache_info().misses
+        self.assertIsNotNone(plot_function(result['data']))
+        self.assertIsNotNone(plot_function(result['data']))
+        self.assertEqual(_lambdify_cached.cache_info().misses, before + 1)
+
+    def test_clean_data_breaks_at_asymptote(self):
+        x = np.linspace(-1, 1, 10)
+        x_plot, y_plot = visualizer.clean_data_for_plot(x, 1 / x, threshold=50)
+        self.assertEqual(x_plot.size, x.size + 1)
+        self.assertTrue(np.isnan(y_plot[5]))
+        self.assertEqual(np.isnan(y_plot).sum(), 1)
+
+    def test_asymptote_check(self):
+        for text in ("y = x^5 - 3*x", "y = sin(x) + e^x", "y = |x|"):
+            self.assertFalse(_may_have_asymptote(parse_input(text)['data'][0]), text)
+        for text in ("y = 1/x", "y = tan(x)", "y = sqrt(x)", "y = x^(-2)"):
+            self.assertTrue(_may_have_asymptote(parse_input(text)['data'][0]), text)
+
+    def test_reused_axes_do_not_leak_state(self):
+        sine = parse_input("y = sin(x)")
+        visualizer._TLS.__dict__.clear()
+        fresh = plot_function(sine['data']).getvalue()
+        plot_geometry(parse_input("круг r=3"))
+        plot_3d(parse_input("z = x*y"))
+        self.assertEqual(plot_function(sine['data']).getvalue(), fresh)
+
 if __name__ == '__main__':
     unittest.main()
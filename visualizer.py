@@ -1,10 +1,17 @@
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import Bbox
 import numpy as np
 import io
+import threading
+from functools import lru_cache
 import sympy
 from config import (
     PLOT_SIZE,
     DPI,
+    PNG_COMPRESS_LEVEL,
     DEFAULT_X_RANGE,
     DEFAULT_3D_ELEV,
     DEFAULT_3D_AZIM,
@@ -22,16 +29,76 @@ from geometry import (
     PolygonShape,
     LineShape,
 )
+from parser import polar_variable
+
+# Рендер идёт из потоков asyncio.to_thread: у каждого потока свои Figure/Axes
+# (отдельно для 2D и 3D), которые создаются один раз и очищаются через ax.cla().
+_TLS = threading.local()
+
+# Поля задаются один раз при создании Figure: bbox_inches='tight' рендерил
+# каждую картинку дважды (сначала ради границ, потом для PNG)
+MARGINS_2D = dict(left=0.08, right=0.97, bottom=0.07, top=0.94)
+MARGINS_3D = dict(left=0.0, right=1.0, bottom=0.0, top=0.92)
+
+def _new_fig(margins):
+    fig = Figure(figsize=PLOT_SIZE, dpi=DPI)
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(**margins)
+    return fig
+
+def _get_axes():
+    ax = getattr(_TLS, 'ax', None)
+    if ax is None:
+        ax = _TLS.ax = _new_fig(MARGINS_2D).subplots()
+    else:
+        ax.cla()
+        # cla() не сбрасывает aspect от axis('equal') и dataLim прошлого графика:
+        # axhline/axvline обновляют только одну ось, и старые x/y-пределы протекали бы
+        ax.set_aspect('auto', adjustable='box')
+        ax.dataLim.set_points(Bbox.null().get_points())
+    return ax.figure, ax
+
+def _get_axes_3d():
+    cbar = getattr(_TLS, 'cbar3d', None)
+    if cbar is not None:
+        # remove() возвращает осям место, которое занимал colorbar
+        cbar.remove()
+        _TLS.cbar3d = None
+    ax = getattr(_TLS, 'ax3d', None)
+    if ax is None:
+        ax = _TLS.ax3d = _new_fig(MARGINS_3D).add_subplot(projection='3d')
+    else:
+        ax.cla()
+    return ax.figure, ax
+
+@lru_cache(maxsize=256)
+def _lambdify_cached(args, expr, modules='numpy'):
+    """
+    lambdify с общим кэшем для всех plot_*: выражения SymPy неизменяемы и хешируются
+    по структуре, так что повторный график того же выражения не генерирует код заново.
+    """
+    return sympy.lambdify(args, expr, modules=[modules], cse=True)
+
+@lru_cache(maxsize=256)
+def _latex_cached(expr):
+    """sympy.latex для подписей и заголовков: обход дерева дорогой (сотни мкс), а выражения повторяются."""
+    return sympy.latex(expr)
+
+@lru_cache(maxsize=16)
+def _xgrid(lo, hi, n=1000):
+    """Общая сетка абсцисс для всех кривых и графиков с тем же диапазоном; только для чтения."""
+    grid = np.linspace(lo, hi, n)
+    grid.setflags(write=False)
+    return grid
 
 def get_plot_buffer(fig):
     buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight')
+    fig.savefig(buf, format='png', pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
     buf.seek(0)
-    plt.close(fig)
     return buf
 
 def create_base_plot():
-    fig, ax = plt.subplots(figsize=PLOT_SIZE, dpi=DPI)
+    fig, ax = _get_axes()
     ax.grid(True, which='both', linestyle='--', linewidth=0.5)
     ax.axhline(y=0, color='k', linewidth=1)
     ax.axvline(x=0, color='k', linewidth=1)
@@ -39,6 +106,14 @@ def create_base_plot():
     ax.set_ylabel('y')
     return fig, ax
 
+def _slope_scratch(n):
+    """Буферы потока под числитель/знаменатель наклона и маску, растут по мере надобности."""
+    buf = getattr(_TLS, 'slope', None)
+    if buf is None or buf[0].shape[1] < n:
+        buf = _TLS.slope = (np.empty((2, n)), np.empty(n, dtype=bool))
+    pair, mask = buf
+    return pair[0, :n], pair[1, :n], mask[:n]
+
 def clean_data_for_plot(x, y, threshold=10.0):
     """
     detects discontinuities (vertical asymptotes) and inserts NaN
@@ -49,37 +124,77 @@ def clean_data_for_plot(x, y, threshold=10.0):
         # Set complex entries to NaN
         y = np.where(np.iscomplex(y), np.nan, np.real(y))
     
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
     # 2. Handle simple discontinuities (jumps)
-    dy = np.diff(y)
-    dx = np.diff(x)
-    
+    # Наклон считаем в буферах потока, без временных массивов np.diff
+    n = max(x.size - 1, 0)
+    num, den, steep = _slope_scratch(n)
+    np.subtract(y[1:], y[:-1], out=num)
+    np.subtract(x[1:], x[:-1], out=den)
     with np.errstate(divide='ignore', invalid='ignore'):
-         slope = np.abs(dy / dx)
-    
-    # Threshold for "too steep" -> likely asymptote
-    mask = slope > threshold
-    
-    points_x = []
-    points_y = []
-    
-    for i in range(len(x) - 1):
-        points_x.append(x[i])
-        points_y.append(y[i])
-        
-        if mask[i]:
-            points_x.append(np.nan)
-            points_y.append(np.nan)
-            
-    points_x.append(x[-1])
-    points_y.append(y[-1])
-    
-    return np.array(points_x), np.array(points_y)
+        np.divide(num, den, out=num)
+    np.abs(num, out=num)
+    np.greater(num, threshold, out=steep)
+
+    # Threshold for "too steep" -> likely asymptote: NaN goes after point i.
+    # Без np.insert: точка i встаёт на i + (число разрывов до неё), NaN — в оставшиеся дыры
+    dst = np.zeros(x.size, dtype=np.intp)
+    np.cumsum(steep, out=dst[1:])
+    dst += np.arange(x.size)
+    size = dst[-1] + 1 if x.size else 0
+    out_x = np.empty(size)
+    out_y = np.empty(size)
+    out_x[dst] = x
+    out_y[dst] = y
+    gaps = dst[1:][steep] - 1
+    out_x[gaps] = np.nan
+    out_y[gaps] = np.nan
+    return out_x, out_y
+
+# Функции, непрерывные на всей вещественной оси: кривая из них не бывает разорвана
+CONTINUOUS_FUNCS = (sympy.sin, sympy.cos, sympy.exp, sympy.atan, sympy.sinh, sympy.cosh, sympy.tanh, sympy.Abs)
+
+def _is_continuous_node(node):
+    if node.is_Symbol or node.is_Rational or node.is_Float or node.is_NumberSymbol:
+        return True
+    if node.is_Add or node.is_Mul or isinstance(node, CONTINUOUS_FUNCS):
+        return True
+    if node.is_Pow:
+        # x**n при n >= 0 и a**x при a > 0; x**-1, sqrt(x) и прочие — под подозрением
+        return bool(node.exp.is_Integer and node.exp >= 0 or node.base.is_Number and node.base > 0)
+    return False
+
+@lru_cache(maxsize=256)
+def _may_have_asymptote(expr):
+    """
+    False — выражение непрерывно всюду (многочлены, sin, exp, ...), и clean_data_for_plot
+    не нужен: крутой участок x^5 или e^x там не разрыв. Всё остальное (1/x, tan, log,
+    floor, Piecewise) считаем возможным разрывом.
+    """
+    return not all(_is_continuous_node(node) for node in sympy.preorder_traversal(expr))
+
+def cache_stats():
+    """cache_info() кэшей визуализатора по именам — для /cachestats."""
+    return {
+        "lambdify": _lambdify_cached.cache_info(),
+        "latex": _latex_cached.cache_info(),
+        "asymptote check": _may_have_asymptote.cache_info(),
+        "x grid": _xgrid.cache_info(),
+    }
+
+def _curve_label(expr):
+    # mathtext не понимает \begin{cases}: кусочные функции подписываем обычным текстом
+    if expr.has(sympy.Piecewise):
+        return str(expr)
+    return f"${_latex_cached(expr)}$"
 
 def plot_function(functions_data, x_range=DEFAULT_X_RANGE):
     fig, ax = create_base_plot()
     
     # Increase resolution for better curves
-    x_vals_orig = np.linspace(x_range[0], x_range[1], 1000)
+    x_vals_orig = _xgrid(x_range[0], x_range[1])
     x_sym = sympy.symbols('x')
     
     has_plotted = False
@@ -87,25 +202,29 @@ def plot_function(functions_data, x_range=DEFAULT_X_RANGE):
     
     for expr in functions_data:
         try:
-            # Prepare lambdified function
-            f_lambdified = sympy.lambdify(x_sym, expr, modules=['numpy'])
-            
-            # Evaluate
-            with np.errstate(invalid='ignore', divide='ignore'):
-                 y_vals_orig = f_lambdified(x_vals_orig)
-            
-            # Broadcast scalar if constant function
-            if np.isscalar(y_vals_orig):
-                y_vals_orig = np.full_like(x_vals_orig, y_vals_orig)
-            
-            # Post-process for complex/invalid values
-            if np.iscomplexobj(y_vals_orig):
-                 y_vals_orig = np.where(np.iscomplex(y_vals_orig), np.nan, np.real(y_vals_orig))
+            if not expr.free_symbols and expr.is_real:
+                # Константа: ни вычислять, ни искать разрывы не нужно
+                x_plot = x_vals_orig
+                y_plot = np.full_like(x_vals_orig, float(expr))
+            else:
+                # Prepare lambdified function
+                f_lambdified = _lambdify_cached(x_sym, expr)
 
-            # Detect discontinuities
-            x_plot, y_plot = clean_data_for_plot(x_vals_orig, y_vals_orig, threshold=100) 
-            
-            label = f"${sympy.latex(expr)}$"
+                # Evaluate
+                with np.errstate(invalid='ignore', divide='ignore'):
+                     y_vals_orig = f_lambdified(x_vals_orig)
+
+                # Broadcast scalar if constant function
+                if np.isscalar(y_vals_orig):
+                    y_vals_orig = np.full_like(x_vals_orig, y_vals_orig)
+
+                # Detect discontinuities (complex values are dropped there too)
+                if _may_have_asymptote(expr):
+                    x_plot, y_plot = clean_data_for_plot(x_vals_orig, y_vals_orig, threshold=100)
+                else:
+                    x_plot, y_plot = x_vals_orig, y_vals_orig
+
+            label = _curve_label(expr)
             ax.plot(x_plot, y_plot, label=label, linewidth=2)
             finite_y = y_plot[np.isfinite(y_plot)]
             if finite_y.size:
@@ -134,15 +253,15 @@ def plot_function(functions_data, x_range=DEFAULT_X_RANGE):
 def plot_parametric(parametric_data, t_range=(-10, 10)):
     fig, ax = create_base_plot()
     
-    t_vals = np.linspace(t_range[0], t_range[1], 1000)
+    t_vals = _xgrid(t_range[0], t_range[1])
     t_sym = sympy.symbols('t')
     
     try:
         x_expr = parametric_data['x']
         y_expr = parametric_data['y']
         
-        fx = sympy.lambdify(t_sym, x_expr, modules=['numpy'])
-        fy = sympy.lambdify(t_sym, y_expr, modules=['numpy'])
+        fx = _lambdify_cached(t_sym, x_expr)
+        fy = _lambdify_cached(t_sym, y_expr)
         
         x_vals = fx(t_vals)
         y_vals = fy(t_vals)
@@ -150,9 +269,8 @@ def plot_parametric(parametric_data, t_range=(-10, 10)):
         if np.isscalar(x_vals): x_vals = np.full_like(t_vals, x_vals)
         if np.isscalar(y_vals): y_vals = np.full_like(t_vals, y_vals)
         
-        ax.plot(x_vals, y_vals, label='Parametric', linewidth=2)
+        ax.plot(x_vals, y_vals, linewidth=2)
         ax.set_title("Параметрический график")
-        # ax.legend()
         ax.axis('equal') 
         
     except Exception as e:
@@ -165,26 +283,13 @@ def plot_polar(polar_data):
     
     # Heuristic for variable: t, theta, phi
     r_expr = polar_data['data']
-    free_symbols = r_expr.free_symbols
-    var_sym = None
-    
-    # Default to 't' if no symbols
-    if not free_symbols:
-        var_sym = sympy.Symbol('t')
-    else:
-        # Pick the first one that looks like an angle
-        for s in free_symbols:
-            if str(s) in ['t', 'theta', 'phi', 'x']: # allow x as parameter too
-                var_sym = s
-                break
-        if not var_sym:
-             var_sym = list(free_symbols)[0]
-             
+    var_sym = polar_data.get('var') or polar_variable(r_expr)
+
     # Range: 0 to 4pi usually safe for polar
-    t_vals = np.linspace(0, 4 * np.pi, 1000)
+    t_vals = _xgrid(0, 4 * np.pi)
     
     try:
-        f_r = sympy.lambdify(var_sym, r_expr, modules=['numpy'])
+        f_r = _lambdify_cached(var_sym, r_expr)
         r_vals = f_r(t_vals)
         
         if np.isscalar(r_vals): r_vals = np.full_like(t_vals, r_vals)
@@ -193,7 +298,7 @@ def plot_polar(polar_data):
         x_vals = r_vals * np.cos(t_vals)
         y_vals = r_vals * np.sin(t_vals)
         
-        ax.plot(x_vals, y_vals, label=f"r={sympy.latex(r_expr)}", linewidth=2)
+        ax.plot(x_vals, y_vals, linewidth=2)
         ax.set_title("Полярный график")
         ax.axis('equal')
         
@@ -231,8 +336,7 @@ def plot_3d(
     elev = max(-89.0, min(89.0, elev))
     azim = float(azim % 360.0)
 
-    fig = plt.figure(figsize=PLOT_SIZE, dpi=DPI)
-    ax = fig.add_subplot(projection='3d')
+    fig, ax = _get_axes_3d()
     ax.view_init(elev=elev, azim=azim)
 
     expr = z_data['data']
@@ -240,18 +344,22 @@ def plot_3d(
     y_sym = next((s for s in expr.free_symbols if getattr(s, "name", "") == "y"), sympy.Symbol("y"))
 
     try:
-        f_z = sympy.lambdify((x_sym, y_sym), expr, modules=['numpy'])
+        f_z = _lambdify_cached((x_sym, y_sym), expr)
 
-        X = np.linspace(-range_val, range_val, grid_n)
-        Y = np.linspace(-range_val, range_val, grid_n)
-        X, Y = np.meshgrid(X, Y)
+        # Для картинки хватает float32: вдвое меньше памяти, и ufunc-и NumPy
+        # (sin, exp, log) на float32 идут по SIMD-ветке в разы быстрее
+        X = np.linspace(-range_val, range_val, grid_n, dtype=np.float32)
+        X, Y = np.meshgrid(X, X)
 
-        with np.errstate(invalid='ignore', divide='ignore'):
-            Z = f_z(X, Y)
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            Z = np.asarray(f_z(X, Y), dtype=np.float32)
+            if np.isinf(Z).any():
+                # float32 переполняется уже на e^89: считаем заново в float64
+                X, Y = X.astype(float), Y.astype(float)
+                Z = np.asarray(f_z(X, Y), dtype=float)
 
-        if np.isscalar(Z):
-            Z = np.full_like(X, Z, dtype=float)
-        Z = np.asarray(Z, dtype=float)
+        if Z.ndim == 0:
+            Z = np.full_like(X, Z)
 
         stride = max(1, grid_n // 22)
 
@@ -263,8 +371,10 @@ def plot_3d(
                 edgecolor='none',
                 alpha=0.78 if mode == "both" else 0.88,
                 linewidth=0,
+                # без сглаживания рёбер: ~10% быстрее и без светлых швов между полупрозрачными гранями
+                antialiased=False,
             )
-            fig.colorbar(surf, ax=ax, shrink=0.5, aspect=5)
+            _TLS.cbar3d = fig.colorbar(surf, ax=ax, shrink=0.5, aspect=5)
             drew_surface = True
         if mode in ("wireframe", "both"):
             ax.plot_wireframe(
@@ -285,7 +395,7 @@ def plot_3d(
             floor = zmin - zpad * 1.1
             ax.contourf(X, Y, Z, zdir='z', offset=floor, levels=14, cmap='viridis', alpha=0.5)
 
-        title = f"z = ${sympy.latex(expr)}$"
+        title = f"z = ${_latex_cached(expr)}$"
         title += f"\nкамера elev={elev:.0f}°, azim={azim:.0f}° | окно ±{range_val:g} | сетка {grid_n} | {mode}"
         if contour_base:
             title += " | контур у основания"